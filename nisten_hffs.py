@@ -4,18 +4,456 @@
 Zero-disk network storage for AI models and datasets
 """
 
+# subprocess, signal and tarfile are imported where they're used; nothing
+# on the startup path loads them otherwise
 import os
+import re
 import sys
+import mmap
+import stat
 import time
-import signal
-import json
+import errno
+import select
+import shutil
+import logging
+import functools
+import itertools
 import threading
-import subprocess
 from pathlib import Path
 from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-# Enable fast transfers
-os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "1"
+logger = logging.getLogger("nisten_hffs")
+
+# Enable fast transfers when the native uploader is available (must be set
+# before huggingface_hub is imported). Without it uploads use plain requests.
+try:
+    import hf_transfer  # noqa: F401
+    os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "1"
+except ImportError:
+    pass
+
+# Import heavy dependencies once; check_requirements installs them if missing
+try:
+    from huggingface_hub import HfApi, HfFileSystem, CommitScheduler, get_token
+    from fsspec.fuse import FUSEr
+    from fuse import FUSE
+    _HF_OK = True
+    _HF_ERROR = None
+except (ImportError, OSError) as e:
+    # fusepy raises OSError at import time when libfuse itself is missing
+    _HF_OK = False
+    _HF_ERROR = e
+
+# requests-based huggingface_hub (<1.0) lets us size its connection pool
+try:
+    from huggingface_hub import configure_http_backend
+    from huggingface_hub.utils._http import _default_backend_factory
+    from urllib3.util.retry import Retry
+except ImportError:
+    configure_http_backend = None
+
+# Lock file (de)serialization; orjson when available
+try:
+    import orjson
+    _DUMPS = orjson.dumps
+    _LOADS = orjson.loads
+except ImportError:
+    import json
+    _DUMPS = lambda obj: json.dumps(obj).encode()
+    _LOADS = json.loads
+
+# Optional libfuse3 backend; falls back to fsspec's fusepy operations
+try:
+    import pyfuse3
+    import trio
+except ImportError:
+    pyfuse3 = None
+
+if _HF_OK:
+    class NistenHfApi(HfApi):
+        """HfApi that uploads scheduled commits with more parallel workers"""
+        
+        UPLOAD_WORKERS = 8
+        
+        def create_commit(self, *args, num_threads=UPLOAD_WORKERS, **kwargs):
+            # Preupload/LFS calls are batched per commit; widen the upload pool
+            return super().create_commit(*args, num_threads=num_threads, **kwargs)
+    
+    class NistenCommitScheduler(CommitScheduler):
+        """CommitScheduler that bundles small files into one tar per commit"""
+        
+        SMALL_FILE_SIZE = 8 * 1024 * 1024
+        BATCH_PREFIX = "_nisten_small_batch_"
+        # Skip files touched this recently, they may still be mid-copy
+        QUIET_SECONDS = 5
+        
+        def __init__(self, *args, **kwargs):
+            # Originals waiting on their tar's commit: path -> (tar, size, mtime).
+            # Set before super() starts the scheduler thread.
+            self.bundled = {}
+            super().__init__(*args, **kwargs)
+        
+        def _run_scheduler(self):
+            # Uploads are background work; let interactive load preempt them
+            try:
+                os.sched_setscheduler(0, os.SCHED_BATCH, os.sched_param(0))
+            except (AttributeError, OSError):
+                pass
+            super()._run_scheduler()
+        
+        def push_to_hub(self):
+            with self.lock:
+                try:
+                    self.bundle_small_files()
+                except Exception as e:
+                    # Still upload; the small files just go up one by one
+                    logger.warning("Bundling small files failed: %s", e)
+            commit = super().push_to_hub()
+            with self.lock:
+                self.drop_uploaded_originals()
+            return commit
+        
+        def bundle_small_files(self):
+            """Pack pending small files into a single tar in the cache"""
+            import tarfile
+            
+            now = time.time()
+            small = []
+            for root, _, files in os.walk(self.folder_path):
+                for name in files:
+                    path = Path(root) / name
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        continue
+                    if (name.startswith(self.BATCH_PREFIX)
+                            or st.st_size >= self.SMALL_FILE_SIZE
+                            or now - st.st_mtime < self.QUIET_SECONDS
+                            or self.last_uploaded.get(path) == st.st_mtime):
+                        continue
+                    small.append((path, st))
+            
+            if len(small) < 2:
+                return
+            
+            # Build next to (not inside) the watched folder so a partial tar is
+            # never uploaded, then move it in under a name no other batch can take
+            batch = self.folder_path / f"{self.BATCH_PREFIX}{time.time_ns()}.tar"
+            tmp = self.folder_path.parent / f".{batch.name}.partial"
+            try:
+                with tarfile.open(tmp, "x") as tar:
+                    for path, _ in small:
+                        tar.add(path, arcname=path.relative_to(self.folder_path).as_posix())
+                os.link(tmp, batch)
+            finally:
+                tmp.unlink(missing_ok=True)
+            
+            # The tar carries these files now. Mark them as uploaded so they
+            # don't also go up one by one, but keep them until the tar commits.
+            for path, st in small:
+                self.last_uploaded[path] = st.st_mtime
+                self.bundled[path] = (batch, st.st_size, st.st_mtime)
+        
+        def drop_uploaded_originals(self):
+            """Remove bundled originals whose tar has been committed"""
+            for path, (batch, size, mtime) in list(self.bundled.items()):
+                if batch not in self.last_uploaded:
+                    continue
+                del self.bundled[path]
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                # Written to since bundling: keep it; its new mtime puts it
+                # in the next batch
+                if (st.st_size, st.st_mtime) == (size, mtime):
+                    path.unlink(missing_ok=True)
+                    self.last_uploaded.pop(path, None)
+    
+    class HfFUSEr(FUSEr):
+        """fsspec's FUSEr with reads served by the shared HfReader
+        
+        FUSEr itself shares one file object per fh and bumps its fh counter
+        unguarded, which breaks under libfuse's multithreaded dispatch.
+        """
+        
+        def __init__(self, reader, path):
+            super().__init__(reader.fs, path)
+            self.reader = reader
+        
+        def open(self, path, flags):
+            # The mount is read-only, so only read handles are ever opened
+            return self.reader.open("".join([self.root, path.lstrip("/")]).rstrip("/"))
+        
+        def read(self, path, size, offset, fh):
+            return self.reader.read(fh, offset, size)
+        
+        def release(self, path, fh):
+            self.reader.release(fh)
+            return 0
+
+if configure_http_backend is not None:
+    def pooled_session():
+        """Hub's default session with a keep-alive pool sized for parallel FUSE reads"""
+        # Keep the hub's own adapters (offline mode, request ids); just widen them
+        session = _default_backend_factory()
+        for adapter in session.adapters.values():
+            adapter.max_retries = Retry(total=3, backoff_factor=0.3)
+            adapter._pool_connections, adapter._pool_maxsize = 32, 64
+            adapter.init_poolmanager(32, 64, block=adapter._pool_block)
+        return session
+
+class SmallFileCache:
+    """LRU of small READ/ files (configs, tokenizers) held in mmap'd memory
+    
+    Entries may also hold just the head of a larger file (see prefetch),
+    in which case only ranges inside the cached prefix are served.
+    """
+    
+    MAX_FILE_SIZE = 1024 * 1024
+    MAX_ENTRIES = 128
+    MAX_BYTES = 256 * 1024 * 1024
+    
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+    
+    def __contains__(self, path):
+        return path in self.entries
+    
+    def get(self, path, off, size):
+        """Return cached bytes for a range, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            m, complete = entry
+            if not complete and off + size > len(m):
+                return None
+            self.entries.move_to_end(path)
+            return m[off:off + size]
+    
+    def put(self, path, data, complete=True):
+        if not data:
+            return
+        # Anonymous mapping keeps the bytes out of the Python heap
+        m = mmap.mmap(-1, len(data))
+        m.write(data)
+        with self.lock:
+            self.evict(path)
+            self.entries[path] = (m, complete)
+            self.size += len(m)
+            while len(self.entries) > self.MAX_ENTRIES or self.size > self.MAX_BYTES:
+                self.evict(next(iter(self.entries)))
+    
+    def evict(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+            entry[0].close()
+    
+    def clear(self):
+        with self.lock:
+            for path in list(self.entries):
+                self.evict(path)
+
+class HfReader:
+    """Read path for READ/ shared by both FUSE backends
+    
+    Small files come from SmallFileCache, larger ones through readahead
+    file handles, and opening shard N warms the head of shard N+1. All
+    methods block on the network and may be called from many threads.
+    """
+    
+    # Files under READ/ are read sequentially; fetch well ahead of the kernel
+    READAHEAD_SIZE = 4 * 1024 * 1024
+    # Sharded checkpoints are loaded in order; warm shard N+1 on open of N
+    SHARD_PATTERN = re.compile(r"-(\d+)-of-(\d+)\.safetensors$")
+    PREFETCH_SIZE = 8 * 1024 * 1024
+    
+    def __init__(self, fs):
+        self.fs = fs
+        self.handles = {}
+        self.small_files = SmallFileCache()
+        self.prefetch_pool = ThreadPoolExecutor(max_workers=2)
+        # Only in-flight prefetches; finished ones are found in small_files
+        self.prefetching = set()
+        self.prefetch_lock = threading.Lock()
+        self.next_fh = itertools.count(1)
+        self.new_lock = threading.Lock
+    
+    def open(self, path):
+        info = self.fs.info(path)
+        
+        # Small files are fetched once and served from memory afterwards
+        if (info.get("size") or 0) <= SmallFileCache.MAX_FILE_SIZE:
+            if path not in self.small_files:
+                self.small_files.put(path, self.fs.cat_file(path))
+            handle = (path, None, None)
+        else:
+            f = self.fs.open(path, "rb", block_size=self.READAHEAD_SIZE,
+                             cache_type="readahead")
+            handle = (path, f, self.new_lock())
+        
+        fh = next(self.next_fh)
+        self.handles[fh] = handle
+        self.prefetch_next_shard(path)
+        return fh
+    
+    def read(self, fh, off, size):
+        path, f, lock = self.handles[fh]
+        data = self.small_files.get(path, off, size)
+        if data is not None:
+            return data
+        if f is None:
+            # Evicted since open()
+            return self.fs.cat_file(path, start=off, end=off + size)
+        with lock:
+            f.seek(off)
+            return f.read(size)
+    
+    def release(self, fh):
+        _, f, _ = self.handles.pop(fh)
+        if f is not None:
+            f.close()
+    
+    def prefetch_next_shard(self, path):
+        match = self.SHARD_PATTERN.search(path)
+        if not match:
+            return
+        index, total = match.groups()
+        if int(index) >= int(total):
+            return
+        
+        next_index = str(int(index) + 1).zfill(len(index))
+        next_path = f"{path[:match.start()]}-{next_index}-of-{total}.safetensors"
+        with self.prefetch_lock:
+            if next_path in self.prefetching or next_path in self.small_files:
+                return
+            self.prefetching.add(next_path)
+        try:
+            self.prefetch_pool.submit(self.prefetch, next_path)
+        except RuntimeError:
+            # Pool already shut down; the mount is going away
+            self.prefetching.discard(next_path)
+    
+    def prefetch(self, path):
+        """Pull the head of a file (safetensors header + first tensors) into memory"""
+        try:
+            data = self.fs.cat_file(path, start=0, end=self.PREFETCH_SIZE)
+            self.small_files.put(path, data, complete=len(data) < self.PREFETCH_SIZE)
+        except Exception as e:
+            logger.warning("Prefetch of %s failed: %s", path, e)
+        finally:
+            with self.prefetch_lock:
+                self.prefetching.discard(path)
+    
+    def close(self):
+        """Stop prefetching and drop cached data once the mount is gone"""
+        self.prefetch_pool.shutdown(wait=False, cancel_futures=True)
+        self.small_files.clear()
+
+if pyfuse3 is not None:
+    class HfOperations(pyfuse3.Operations):
+        """Read-only libfuse3 operations backed by HfFileSystem"""
+        
+        def __init__(self, reader, root):
+            super().__init__()
+            self.fs = reader.fs
+            self.reader = reader
+            self.paths = {pyfuse3.ROOT_INODE: root.rstrip("/")}
+            self.inodes = {root.rstrip("/"): pyfuse3.ROOT_INODE}
+            self.mtime_ns = time.time_ns()
+        
+        def inode_for(self, path):
+            inode = self.inodes.get(path)
+            if inode is None:
+                inode = pyfuse3.ROOT_INODE + len(self.paths)
+                self.inodes[path] = inode
+                self.paths[inode] = path
+            return inode
+        
+        def path_of(self, inode):
+            try:
+                return self.paths[inode]
+            except KeyError:
+                raise pyfuse3.FUSEError(errno.ENOENT)
+        
+        async def call(self, func, *args, **kwargs):
+            """Run a blocking HfFileSystem call in a worker thread
+            
+            Anything but FUSEError escaping a handler stops pyfuse3.main and
+            leaves a dead mount, so every failure is mapped to an errno.
+            """
+            try:
+                return await trio.to_thread.run_sync(functools.partial(func, *args, **kwargs))
+            except pyfuse3.FUSEError:
+                raise
+            except FileNotFoundError:
+                # HfFileSystem raises it without an errno
+                raise pyfuse3.FUSEError(errno.ENOENT)
+            except OSError as e:
+                raise pyfuse3.FUSEError(e.errno or errno.EIO)
+            except Exception:
+                raise pyfuse3.FUSEError(errno.EIO)
+        
+        def attrs(self, inode, info):
+            entry = pyfuse3.EntryAttributes()
+            entry.st_ino = inode
+            if info["type"] == "directory":
+                entry.st_mode = stat.S_IFDIR | 0o555
+                entry.st_nlink = 2
+            else:
+                entry.st_mode = stat.S_IFREG | 0o444
+                entry.st_nlink = 1
+            entry.st_size = info.get("size") or 0
+            entry.st_blksize = 1024 * 1024
+            entry.st_blocks = (entry.st_size + 511) // 512
+            entry.st_uid = os.getuid()
+            entry.st_gid = os.getgid()
+            entry.st_atime_ns = entry.st_mtime_ns = entry.st_ctime_ns = self.mtime_ns
+            entry.attr_timeout = entry.entry_timeout = 60
+            return entry
+        
+        async def getattr(self, inode, ctx=None):
+            path = self.path_of(inode)
+            return self.attrs(inode, await self.call(self.fs.info, path))
+        
+        async def lookup(self, parent_inode, name, ctx=None):
+            path = self.path_of(parent_inode)
+            if name == b"..":
+                path = path.rsplit("/", 1)[0] if parent_inode != pyfuse3.ROOT_INODE else path
+            elif name != b".":
+                path = f"{path}/{os.fsdecode(name)}"
+            info = await self.call(self.fs.info, path)
+            return self.attrs(self.inode_for(path), info)
+        
+        async def opendir(self, inode, ctx):
+            self.path_of(inode)
+            return inode
+        
+        async def readdir(self, fh, start_id, token):
+            entries = await self.call(self.fs.ls, self.path_of(fh), detail=True)
+            for i, info in enumerate(entries[start_id:], start_id):
+                path = info["name"].rstrip("/")
+                name = os.fsencode(path.rsplit("/", 1)[-1])
+                if not pyfuse3.readdir_reply(token, name, self.attrs(self.inode_for(path), info), i + 1):
+                    break
+        
+        async def open(self, inode, flags, ctx):
+            if flags & (os.O_WRONLY | os.O_RDWR):
+                raise pyfuse3.FUSEError(errno.EROFS)
+            fh = await self.call(self.reader.open, self.path_of(inode))
+            return pyfuse3.FileInfo(fh=fh, keep_cache=True)
+        
+        async def read(self, fh, off, size):
+            return await self.call(self.reader.read, fh, off, size)
+        
+        async def release(self, fh):
+            self.reader.release(fh)
 
 class NistenHFFS:
     """Nisten's HuggingFace FileSystem"""
@@ -23,6 +461,19 @@ class NistenHFFS:
     VERSION = "1.0.0"
     LOCK_FILE = Path("/tmp/.nisten_hffs.lock")
     
+    # Large kernel requests + page cache for streamed model weights
+    FUSE_OPTIONS = {
+        'big_writes': True,
+        'max_read': 1024 * 1024,
+        'max_readahead': 4 * 1024 * 1024,
+        'kernel_cache': True,
+        'auto_cache': True,
+        'direct_io': False,
+        'allow_other': False,
+        'ro': True,
+    }
+    PYFUSE3_OPTIONS = {'ro', 'max_read=1048576'}
+    
     def __init__(self):
         self.repo = None
         self.folder = None
@@ -32,111 +483,210 @@ class NistenHFFS:
         self.is_mounted = False
         self.mount_thread = None
         self.scheduler = None
+        self.fs = None
+        self.cache_limit = None
         
     def clear_screen(self):
         """Clear terminal screen"""
-        os.system('clear' if os.name == 'posix' else 'cls')
+        if sys.stdout.isatty():
+            sys.stdout.write("\x1b[H\x1b[2J\x1b[3J")
+            sys.stdout.flush()
     
     def show_banner(self):
         """Show welcome banner"""
         self.clear_screen()
-        print("""
+        sys.stdout.write("""
 ╭────────────────────────────────────────╮
 │  🐱 NISTEN HFFS v1.0                   │
 │  HuggingFace FileSystem                │
 ╰────────────────────────────────────────╯
-        """)
+        \n""")
     
     def check_existing(self):
         """Check for existing mounts"""
-        if self.LOCK_FILE.exists():
-            try:
-                with open(self.LOCK_FILE) as f:
-                    mounts = json.load(f)
-                    if mounts:
-                        print("\n⚠️  Found existing mount:")
-                        for m in mounts:
-                            print(f"   • {m['folder']} → {m['repo']}")
-                            print(f"     Started: {m['time']}")
-                        
-                        print("\nOptions:")
-                        print("  [u] Unmount existing")
-                        print("  [c] Continue anyway")
-                        print("  [q] Quit")
-                        
-                        choice = input("\n→ ").strip().lower()
-                        if choice == 'u':
-                            self.cleanup_existing(mounts)
-                            return True
-                        elif choice == 'q':
-                            return False
-                        return True
-            except:
-                pass
+        # One directory pass finds both the lock and any orphaned read mounts
+        try:
+            with os.scandir(self.LOCK_FILE.parent) as it:
+                entries = {e.name: e for e in it if e.name.startswith('.nisten')}
+        except OSError:
+            entries = {}
+        
+        if self.LOCK_FILE.name not in entries:
+            return self.check_orphans(entries)
+        
+        try:
+            mounts = _LOADS(self.LOCK_FILE.read_bytes())
+            if mounts:
+                lines = ["\n⚠️  Found existing mount:"]
+                for m in mounts:
+                    lines.append(f"   • {m['folder']} → {m['repo']}")
+                    lines.append(f"     Started: {m['time']}")
+                
+                lines += ["\nOptions:", "  [u] Unmount existing",
+                          "  [c] Continue anyway", "  [q] Quit"]
+                sys.stdout.write("\n".join(lines) + "\n")
+                
+                choice = input("\n→ ").strip().lower()
+                if choice == 'u':
+                    self.cleanup_existing(mounts)
+                    return True
+                elif choice == 'q':
+                    return False
+                return True
+        except:
+            pass
         return True
     
+    def check_orphans(self, entries):
+        """Offer to clean up read mounts left behind without a lock file"""
+        # Only real mounts count: tagged ones in the mount table, plus any
+        # untagged .nisten_*_ro dir that is still a mount point
+        folders = set(self.tagged_mounts())
+        for name, e in entries.items():
+            folder = name[len('.nisten_'):-len('_ro')]
+            if (name.endswith('_ro') and self.valid_folder(folder)
+                    and os.path.ismount(e.path)):
+                folders.add(folder)
+        folders = sorted(folders)
+        if not folders:
+            return True
+        
+        lines = ["\n⚠️  Found leftover mounts (no lock file):"]
+        lines += [f"   • {folder}" for folder in folders]
+        lines += ["\nOptions:", "  [u] Clean up leftovers",
+                  "  [c] Continue anyway", "  [q] Quit"]
+        sys.stdout.write("\n".join(lines) + "\n")
+        
+        choice = input("\n→ ").strip().lower()
+        if choice == 'u':
+            self.cleanup_existing([{'folder': folder} for folder in folders])
+        return choice != 'q'
+    
     def cleanup_existing(self, mounts):
         """Clean up existing mounts"""
-        for mount in mounts:
-            path = Path.home() / mount['folder']
-            subprocess.run(['fusermount', '-u', str(path / 'READ')], capture_output=True)
-            subprocess.run(['rm', '-rf', f"/tmp/.nisten_{mount['folder']}_ro"], capture_output=True)
-            subprocess.run(['rm', '-rf', f"/dev/shm/nisten_{mount['folder']}_cache"], capture_output=True)
+        import subprocess
+        
+        live = self.tagged_mounts()
+        
+        def cleanup(mount):
+            readonly = f"/tmp/.nisten_{mount['folder']}_ro"
+            target = live.get(mount['folder'], readonly)
+            subprocess.run(['fusermount', '-u', '-z', target], capture_output=True)
+            # rmdir, not rmtree: never recurse into a mount that didn't go away
+            try:
+                os.rmdir(readonly)
+            except OSError:
+                pass
+            cache_dir = self.owned_cache_dir(mount)
+            if cache_dir:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+        
+        # The lock lives in world-writable /tmp; only act on names we'd create
+        # Only the mounts the user was shown; other sessions may still be live
+        mounts = [m for m in mounts if self.valid_folder(m.get('folder'))]
+        
+        # Unmounts are independent, so don't wait on them one by one
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(cleanup, mounts))
         self.LOCK_FILE.unlink(missing_ok=True)
         print("✅ Cleaned up existing mounts")
         time.sleep(1)
     
+    def tagged_mounts(self):
+        """Live mounts tagged fsname=nisten_<folder>, as {folder: mount point}"""
+        mounts = {}
+        try:
+            with open("/proc/self/mountinfo") as f:
+                for line in f:
+                    fields, _, fs_fields = line.partition(" - ")
+                    fstype, source = fs_fields.split()[:2]
+                    if not (fstype.startswith("fuse") and source.startswith("nisten_")):
+                        continue
+                    folder = source[len("nisten_"):].replace("\\040", " ")
+                    if self.valid_folder(folder):
+                        mounts[folder] = fields.split()[4].replace("\\040", " ")
+        except (OSError, ValueError):
+            pass
+        return mounts
+    
+    def valid_folder(self, folder):
+        """Whether a folder name from the lock is a plain name in ~/"""
+        return (isinstance(folder, str) and folder not in ("", ".", "..")
+                and "/" not in folder and "\0" not in folder)
+    
+    def owned_cache_dir(self, mount):
+        """Cache dir recorded in the lock, if it's one get_config() could pick"""
+        name = f"nisten_{mount['folder']}_cache"
+        cache_dir = Path(mount.get('cache_dir') or Path("/dev/shm") / name)
+        roots = [Path("/dev/shm")] + [mnt for mnt, _ in self.hugepage_tmpfs()]
+        if cache_dir.name != name or cache_dir.parent not in roots:
+            print(f"⚠️  Not removing unexpected cache path {cache_dir}")
+            return None
+        return cache_dir
+    
     def check_requirements(self):
         """Check system requirements"""
         print("\n🔍 Checking requirements...")
         
         # Check Python packages
-        try:
-            from huggingface_hub import HfFileSystem, HfFolder, CommitScheduler
-            from fsspec.fuse import run
+        if _HF_OK:
             print("   ✓ Python packages")
-        except ImportError:
-            print("   📦 Installing packages...")
-            subprocess.run([
+        elif isinstance(_HF_ERROR, OSError):
+            self.show_fuse_help()
+            return False
+        elif os.environ.get("NISTEN_HFFS_REEXEC"):
+            # Already installed and restarted once; pip can't fix this import
+            print(f"\n❌ Python packages still unusable after install: {_HF_ERROR}")
+            return False
+        else:
+            import subprocess
+            print(f"   📦 Installing packages ({_HF_ERROR})...")
+            result = subprocess.run([
                 sys.executable, "-m", "pip", "install", "-q",
                 "huggingface_hub[hf_transfer]", "fsspec[fuse]"
             ])
-            from huggingface_hub import HfFileSystem, HfFolder, CommitScheduler
-            from fsspec.fuse import run
+            if result.returncode != 0:
+                print("\n❌ Package install failed")
+                return False
             print("   ✓ Python packages installed")
+            # Restart (once) so the module-level imports pick up the new packages
+            os.environ["NISTEN_HFFS_REEXEC"] = "1"
+            os.execv(sys.executable, [sys.executable] + sys.argv)
         
         # Check auth
-        from huggingface_hub import get_token
-        token = HfFolder.get_token()
+        token = get_token()
         if not token:
-            print("\n❌ Not logged in to HuggingFace")
-            print("\nPlease run:")
-            print("  huggingface-cli login")
-            print("\nThen try again.")
+            sys.stdout.write("\n❌ Not logged in to HuggingFace\n"
+                             "\nPlease run:\n"
+                             "  huggingface-cli login\n"
+                             "\nThen try again.\n")
             return False
         print("   ✓ HuggingFace auth")
         
         # Check FUSE
         if not Path("/dev/fuse").exists():
-            print("\n❌ FUSE not installed")
-            print("\nPlease run:")
-            print("  sudo apt-get install fuse")
-            print("  sudo usermod -a -G fuse $USER")
-            print("\nThen logout and login again.")
+            self.show_fuse_help()
             return False
         print("   ✓ FUSE support")
         
         return True
     
+    def show_fuse_help(self):
+        """Explain how to install FUSE"""
+        sys.stdout.write("\n❌ FUSE not installed\n"
+                         "\nPlease run:\n"
+                         "  sudo apt-get install fuse\n"
+                         "  sudo usermod -a -G fuse $USER\n"
+                         "\nThen logout and login again.\n")
+    
     def get_config(self):
         """Get configuration from user"""
-        print("\n📝 Configuration")
-        print("─" * 40)
+        sys.stdout.write("\n📝 Configuration\n" + "─" * 40 + "\n")
         
         # Get repo
-        print("\nHuggingFace repository:")
-        print("  Format: username/repo-name")
-        print("  Example: meta-llama/Llama-2-7b")
+        sys.stdout.write("\nHuggingFace repository:\n"
+                         "  Format: username/repo-name\n"
+                         "  Example: meta-llama/Llama-2-7b\n")
         self.repo = input("\n→ Repository: ").strip()
         if not self.repo:
             print("❌ Repository required")
@@ -149,14 +699,14 @@ class NistenHFFS:
         
         # Setup paths
         self.mount_point = Path.home() / self.folder
-        self.cache_dir = Path("/dev/shm") / f"nisten_{self.folder}_cache"
+        self.cache_dir = self.get_cache_root() / f"nisten_{self.folder}_cache"
         self.readonly_mount = Path("/tmp") / f".nisten_{self.folder}_ro"
         
         # Check if mount point exists
         if self.mount_point.exists() and list(self.mount_point.iterdir()):
-            print(f"\n⚠️  ~/{self.folder}/ already exists and has files")
-            print("  [o] Overwrite")
-            print("  [c] Choose different name")
+            sys.stdout.write(f"\n⚠️  ~/{self.folder}/ already exists and has files\n"
+                             "  [o] Overwrite\n"
+                             "  [c] Choose different name\n")
             choice = input("\n→ ").strip().lower()
             if choice == 'c':
                 return self.get_config()
@@ -165,10 +715,68 @@ class NistenHFFS:
         
         return True
     
+    def get_cache_root(self):
+        """Pick the RAM disk for the write cache, preferring hugepage tmpfs"""
+        shm = Path("/dev/shm")
+        try:
+            st = os.statvfs(shm)
+            shm_free = st.f_bavail * st.f_frsize
+        except OSError:
+            return shm
+        
+        # Transparent hugepages only help if the mount can hold the upload
+        for mnt, free in self.hugepage_tmpfs():
+            if free >= shm_free:
+                return mnt
+        return shm
+    
+    def hugepage_tmpfs(self):
+        """Writable tmpfs mounts with transparent hugepages, with free bytes"""
+        try:
+            with open("/proc/self/mounts") as f:
+                mounts = [line.split() for line in f]
+        except OSError:
+            return []
+        
+        found = []
+        for _, mnt, fstype, opts, *_ in mounts:
+            if fstype != "tmpfs":
+                continue
+            opts = dict(o.partition("=")[::2] for o in opts.split(","))
+            if opts.get("huge") not in ("always", "within_size"):
+                continue
+            
+            mnt = mnt.replace("\\040", " ")
+            try:
+                st = os.statvfs(mnt)
+            except OSError:
+                continue
+            if os.access(mnt, os.W_OK):
+                found.append((Path(mnt), st.f_bavail * st.f_frsize))
+        return found
+    
+    def get_nic_cpus(self):
+        """CPUs on the NUMA node of the default-route NIC, or None"""
+        try:
+            with open("/proc/net/route") as f:
+                next(f)
+                iface = next(line.split()[0] for line in f if line.split()[1] == "00000000")
+            node = int(Path(f"/sys/class/net/{iface}/device/numa_node").read_text())
+            if node < 0:
+                return None
+            cpulist = Path(f"/sys/devices/system/node/node{node}/cpulist").read_text()
+        except (OSError, StopIteration, ValueError):
+            return None
+        
+        cpus = set()
+        for part in cpulist.strip().split(","):
+            lo, _, hi = part.partition("-")
+            cpus.update(range(int(lo), int(hi or lo) + 1))
+        return cpus & os.sched_getaffinity(0) or None
+    
     def mount(self):
         """Mount the filesystem"""
-        from huggingface_hub import HfFileSystem, CommitScheduler
-        from fsspec.fuse import run
+        import subprocess
         
         print(f"\n🔌 Mounting {self.repo}...")
         
@@ -181,12 +789,38 @@ class NistenHFFS:
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
         # Mount HF repo read-only
-        fs = HfFileSystem()
+        if self.fs is None:
+            if configure_http_backend is not None:
+                configure_http_backend(backend_factory=pooled_session)
+            self.fs = HfFileSystem()
+        
+        # Tag the mount so it can be found in the mount table by name
+        fsname = f"nisten_{self.folder}"
+        nic_cpus = self.get_nic_cpus()
         
         def mount_worker():
             try:
-                run(fs, f"{self.repo}/", str(self.readonly_mount),
-                    foreground=True, threads=False)
+                # Keep FUSE handlers (and the threads they spawn) near the NIC
+                if nic_cpus:
+                    os.sched_setaffinity(0, nic_cpus)
+                reader = HfReader(self.fs)
+                try:
+                    if pyfuse3 is not None:
+                        options = set(pyfuse3.default_options) | self.PYFUSE3_OPTIONS
+                        options.add(f"fsname={fsname}")
+                        pyfuse3.init(HfOperations(reader, self.repo),
+                                     str(self.readonly_mount), options)
+                        try:
+                            trio.run(pyfuse3.main)
+                        finally:
+                            pyfuse3.close(unmount=False)
+                    else:
+                        # fsspec's run() drops extra kwargs, so call FUSE directly
+                        FUSE(HfFUSEr(reader, f"{self.repo}/"), str(self.readonly_mount),
+                             foreground=True, nothreads=False, fsname=fsname,
+                             **self.FUSE_OPTIONS)
+                finally:
+                    reader.close()
             except:
                 pass
         
@@ -194,58 +828,102 @@ class NistenHFFS:
         self.mount_thread.start()
         
         # Wait for mount
-        for _ in range(30):
-            time.sleep(0.1)
-            try:
-                list(self.readonly_mount.iterdir())
-                break
-            except:
-                continue
-        else:
+        if not self.wait_for_mount():
             print("❌ Mount failed")
             return False
         
         # Setup write scheduler
         print("   ✓ Read mount ready")
         
-        self.scheduler = CommitScheduler(
+        self.scheduler = NistenCommitScheduler(
             repo_id=self.repo,
             folder_path=self.cache_dir,
             path_in_repo="uploads",
             every=2,
-            squash_history=True
+            squash_history=True,
+            hf_api=NistenHfApi()
         )
         print("   ✓ Write cache ready")
         
-        # Create symlinks
-        read_link = self.mount_point / "READ"
-        write_link = self.mount_point / "WRITE"
-        
-        for link in [read_link, write_link]:
-            if link.exists():
-                link.unlink()
-        
-        read_link.symlink_to(self.readonly_mount)
-        write_link.symlink_to(self.cache_dir)
+        # Create symlinks (resolve the mount point once, then work off its fd)
+        fd = os.open(self.mount_point, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            for name, target in [("READ", self.readonly_mount), ("WRITE", self.cache_dir)]:
+                try:
+                    os.unlink(name, dir_fd=fd)
+                except FileNotFoundError:
+                    pass
+                os.symlink(target, name, dir_fd=fd)
+        finally:
+            os.close(fd)
         
         # Update lock file
         lock_data = [{
             'repo': self.repo,
             'folder': self.folder,
+            'cache_dir': str(self.cache_dir),
             'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }]
-        with open(self.LOCK_FILE, 'w') as f:
-            json.dump(lock_data, f)
+        # Write then rename so a crash never leaves a half-written lock
+        tmp = self.LOCK_FILE.with_suffix('.tmp')
+        tmp.write_bytes(_DUMPS(lock_data))
+        os.replace(tmp, self.LOCK_FILE)
         
         self.is_mounted = True
         print("   ✓ Mount complete")
         
         return True
     
+    def wait_for_mount(self, timeout=3.0):
+        """Block until the read mount appears in the kernel mount table"""
+        deadline = time.monotonic() + timeout
+        # mountinfo escapes spaces in mount points as \040
+        target = " %s " % str(self.readonly_mount).replace(" ", "\\040")
+        
+        try:
+            fd = os.open("/proc/self/mountinfo", os.O_RDONLY)
+        except OSError:
+            return self.wait_for_mount_inotify(deadline)
+        
+        try:
+            # mountinfo raises POLLPRI|POLLERR whenever the mount table changes
+            poller = select.poll()
+            poller.register(fd, select.POLLPRI | select.POLLERR)
+            while True:
+                os.lseek(fd, 0, os.SEEK_SET)
+                chunks = []
+                while chunk := os.read(fd, 65536):
+                    chunks.append(chunk)
+                if target in b"".join(chunks).decode(errors="replace"):
+                    return True
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                poller.poll(remaining * 1000)
+        finally:
+            os.close(fd)
+    
+    def wait_for_mount_inotify(self, deadline):
+        """Fallback mount wait for systems without /proc mountinfo"""
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return os.path.ismount(self.readonly_mount)
+        
+        with INotify() as inot:
+            inot.add_watch(self.readonly_mount.parent, flags.CREATE | flags.ATTRIB)
+            while not os.path.ismount(self.readonly_mount):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                inot.read(timeout=int(remaining * 1000))
+        return True
+    
     def show_tutorial(self):
         """Show usage tutorial"""
         self.clear_screen()
-        print(f"""
+        sys.stdout.write(f"""
 ╭────────────────────────────────────────╮
 │  ✅ NISTEN HFFS READY                  │
 ╰────────────────────────────────────────╯
@@ -268,39 +946,55 @@ class NistenHFFS:
 
 ⚡ FEATURES:
 • Zero disk usage (streams from cloud)
-• Write cache in RAM (/dev/shm)
+• Write cache in RAM ({self.cache_dir.parent})
 • Auto-sync to HuggingFace
-• Fast transfers (HF_TRANSFER enabled)
+• Fast transfers (HF_TRANSFER {'enabled' if os.environ.get('HF_HUB_ENABLE_HF_TRANSFER') else 'not installed'})
 
 ⚠️  NOTES:
 • Deletions don't sync (Git limitation)
+• Small files (<8MB) upload bundled as uploads/_nisten_small_batch_*.tar
+  (they leave WRITE/ once the bundle is uploaded)
 • Max write cache: {self.get_cache_limit()}GB
 • Read-only files stream on-demand
 
 Press Ctrl+C to unmount and exit
-        """)
+Status: kill -USR1 {os.getpid()}
+        \n""")
     
     def get_cache_limit(self):
         """Get RAM cache limit"""
-        try:
-            result = subprocess.run(['df', '-BG', '/dev/shm'], 
-                                  capture_output=True, text=True)
-            size = result.stdout.split('\n')[1].split()[1]
-            return size.replace('G', '')
-        except:
-            return "8"
+        if self.cache_limit is None:
+            try:
+                st = os.statvfs(self.cache_dir.parent)
+                self.cache_limit = str(st.f_blocks * st.f_frsize // (1024 ** 3))
+            except OSError:
+                self.cache_limit = "8"
+        return self.cache_limit
     
     def monitor(self):
         """Monitor mount status"""
+        import signal
+        
+        # Sleep until a signal arrives; SIGINT/SIGTERM unmount and exit
         while self.is_mounted:
-            time.sleep(60)
-            # Could add status checks here
+            signal.pause()
+    
+    def show_status(self):
+        """Print mount diagnostics (sent via SIGUSR1)"""
+        mounted = os.path.ismount(self.readonly_mount)
+        pending = sum(1 for p in self.cache_dir.rglob("*") if p.is_file())
+        sys.stdout.write(f"\n📊 {self.repo} → ~/{self.folder}/\n"
+                         f"   READ:  {'mounted' if mounted else '❌ not mounted'}\n"
+                         f"   WRITE: {pending} file(s) in cache\n")
+        sys.stdout.flush()
     
     def unmount(self):
         """Clean unmount"""
         if not self.is_mounted:
             return
         
+        import subprocess
+        
         print("\n\n🧹 Unmounting...")
         
         # Sync final changes
@@ -315,11 +1009,14 @@ Press Ctrl+C to unmount and exit
         # Unmount FUSE
         subprocess.run(['fusermount', '-u', str(self.readonly_mount)], 
                       capture_output=True)
+        try:
+            self.readonly_mount.rmdir()
+        except OSError:
+            pass
         
         # Clean cache
-        if self.cache_dir and self.cache_dir.exists():
-            subprocess.run(['rm', '-rf', str(self.cache_dir)], 
-                          capture_output=True)
+        if self.cache_dir:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
         
         # Clean mount point
         if self.mount_point:
@@ -329,11 +1026,13 @@ Press Ctrl+C to unmount and exit
         # Remove lock
         self.LOCK_FILE.unlink(missing_ok=True)
         
-        print("   ✓ Unmounted cleanly")
-        print("\nThanks for using Nisten HFFS! 🐱")
+        sys.stdout.write("   ✓ Unmounted cleanly\n"
+                         "\nThanks for using Nisten HFFS! 🐱\n")
     
     def run(self):
         """Main run loop"""
+        import signal
+        
         try:
             # Welcome
             self.show_banner()
@@ -364,6 +1063,7 @@ Press Ctrl+C to unmount and exit
             
             signal.signal(signal.SIGINT, signal_handler)
             signal.signal(signal.SIGTERM, signal_handler)
+            signal.signal(signal.SIGUSR1, lambda sig, frame: self.show_status())
             
             # Monitor
             self.monitor()